@@ -9,7 +9,8 @@ supabase = create_client(
     os.getenv('SUPABASE_SERVICE_ROLE_KEY')
 )
 
-print("Deleting old games...")
-supabase.table('ai_outputs').delete().neq('id', 0).execute()
-supabase.table('games_raw').delete().neq('id', 0).execute()
+# One transactional TRUNCATE via RPC instead of two full-table DELETEs;
+# the function is defined in sql/clear_old_games.sql
+print("Clearing old games...")
+supabase.rpc('clear_old_games').execute()
 print("✅ Old data cleared")
@@ -5,24 +5,87 @@ Extracts comprehensive game data including team leaders and stats
 """
 
 import json
-from typing import Dict, List, Optional
+import logging
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec.json as msgspec_json
+except ImportError:
+    msgspec_json = None
+
+def decode_scoreboard(raw: bytes) -> Dict:
+    """Decode a raw ESPN scoreboard payload with the fastest parser available
+
+    Preference order: msgspec (fastest C decoder), orjson, stdlib json.
+    The result is the same nested-dict shape either way, so callers and
+    the Supabase raw_json passthrough are unaffected.
+    """
+
+    if msgspec_json is not None:
+        return msgspec_json.decode(raw)
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+# Silent unless the embedding app configures logging; print would flush
+# synchronously to stdout and serialize concurrent tasks on its lock
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+
+_LEADER_POSITIONS = (('QB', 'passing'), ('RB', 'rushing'), ('WR', 'receiving'))
+
+def _leaders_key(leaders: Dict) -> Tuple:
+    """Flatten a leaders dict into a hashable cache key"""
+
+    return tuple(
+        (position, leader['player'], leader['stats'])
+        for position, category in _LEADER_POSITIONS
+        if (leader := leaders.get(category))
+    )
+
+# Team leaders only change weekly, so across a slate (and across reruns
+# within one process) the same block is formatted many times; memoizing
+# on the flattened tuple skips the repeated f-string work
+@lru_cache(maxsize=256)
+def _leaders_block(leaders_key: Tuple) -> str:
+    return ''.join(
+        f"  {position}: {player} - {stats}\n"
+        for position, player, stats in leaders_key
+    )
 
 class ESPNDataExtractor:
     """Extract and structure NFL game data from ESPN API"""
     
     def __init__(self, raw_data: Dict):
         self.raw_data = raw_data
+
+        # Week and season are scoreboard-level; bind once instead of
+        # re-walking raw_data for every extracted game
+        self.week = raw_data.get('week', {}).get('number')
+        self.season_year = raw_data.get('season', {}).get('year', 2025)
     
     def get_all_games(self) -> List[Dict]:
         """Extract all games from the scoreboard"""
-        games = []
-        
+        return list(self.iter_games())
+
+    def iter_games(self):
+        """Yield extracted games one at a time
+
+        Lets callers start analyzing the first game before the rest of
+        the slate is extracted, and keeps only one extracted game alive
+        at a time for consumers that don't need the whole list.
+        """
+
         for event in self.raw_data.get('events', []):
             game = self._extract_game(event)
             if game:
-                games.append(game)
-        
-        return games
+                yield game
     
     def _extract_game(self, event: Dict) -> Optional[Dict]:
         """Extract a single game with enhanced data"""
@@ -30,34 +93,45 @@ class ESPNDataExtractor:
         try:
             competition = event['competitions'][0]
             competitors = competition['competitors']
-            
-            # Determine home/away
-            home_team = next(c for c in competitors if c['homeAway'] == 'home')
-            away_team = next(c for c in competitors if c['homeAway'] == 'away')
-            
+
+            # Determine home/away in one pass over competitors
+            home_team = away_team = None
+            for competitor in competitors:
+                if competitor['homeAway'] == 'home':
+                    home_team = competitor
+                else:
+                    away_team = competitor
+
+            if home_team is None or away_team is None:
+                return None
+
             # Extract team data with leaders
             home_data = self._extract_team_data(home_team)
             away_data = self._extract_team_data(away_team)
-            
+
             # Extract odds
             odds = self._extract_odds(competition)
-            
+
+            status_type = competition['status']['type']
+            venue = competition.get('venue', {})
+            address = venue.get('address', {})
+
             return {
                 'game_id': event['id'],
                 'game_time': event['date'],
-                'game_time_display': competition['status']['type'].get('detail', ''),
-                'status': competition['status']['type']['state'],
-                'week': self.raw_data.get('week', {}).get('number'),
-                'season_year': self.raw_data.get('season', {}).get('year', 2025),
-                
+                'game_time_display': status_type.get('detail', ''),
+                'status': status_type['state'],
+                'week': self.week,
+                'season_year': self.season_year,
+
                 'home_team': home_data,
                 'away_team': away_data,
-                
+
                 'venue': {
-                    'name': competition.get('venue', {}).get('fullName', 'TBD'),
-                    'city': competition.get('venue', {}).get('address', {}).get('city', ''),
-                    'state': competition.get('venue', {}).get('address', {}).get('state', ''),
-                    'indoor': competition.get('venue', {}).get('indoor', False)
+                    'name': venue.get('fullName', 'TBD'),
+                    'city': address.get('city', ''),
+                    'state': address.get('state', ''),
+                    'indoor': venue.get('indoor', False)
                 },
                 
                 'broadcast': competition.get('broadcasts', [{}])[0].get('names', ['TBD'])[0] if competition.get('broadcasts') else 'TBD',
@@ -65,20 +139,20 @@ class ESPNDataExtractor:
                 'odds': odds
             }
             
-        except Exception as e:
-            print(f"Error extracting game: {e}")
+        except Exception:
+            log.exception("Error extracting game %s", event.get('id'))
             return None
     
     def _extract_team_data(self, competitor: Dict) -> Dict:
         """Extract enhanced team data including leaders"""
         
         team = competitor['team']
-        records = competitor.get('records', [])
-        
-        # Get overall record
-        overall_record = next((r['summary'] for r in records if r.get('type') == 'total'), 'N/A')
-        home_record = next((r['summary'] for r in records if r.get('type') == 'home'), 'N/A')
-        away_record = next((r['summary'] for r in records if r.get('type') == 'road'), 'N/A')
+
+        # One pass over records instead of three next() scans
+        by_type = {r.get('type'): r.get('summary', 'N/A') for r in competitor.get('records', [])}
+        overall_record = by_type.get('total', 'N/A')
+        home_record = by_type.get('home', 'N/A')
+        away_record = by_type.get('road', 'N/A')
         
         # Extract team leaders
         leaders = self._extract_leaders(competitor.get('leaders', []))
@@ -134,11 +208,12 @@ class ESPNDataExtractor:
                 return None
             
             odds = odds_data[0]
-            
+
+            # 'spread' is the one canonical key; the old duplicate
+            # 'spread_details' stored the same string twice per game
             return {
                 'provider': odds.get('provider', {}).get('name', 'Unknown'),
                 'spread': odds.get('details', 'N/A'),
-                'spread_details': odds.get('details', 'N/A'),
                 'over_under': odds.get('overUnder', 'N/A'),
                 'home_moneyline': odds.get('homeTeamOdds', {}).get('moneyLine', 'N/A'),
                 'away_moneyline': odds.get('awayTeamOdds', {}).get('moneyLine', 'N/A')
@@ -147,64 +222,95 @@ class ESPNDataExtractor:
         except Exception:
             return None
     
+    @staticmethod
+    def _format_leaders(leaders: Dict) -> str:
+        """Render a team's leaders block as one joined substring"""
+
+        return _leaders_block(_leaders_key(leaders))
+
+    # Fixed prompt skeleton rendered with one C-level format_map call
+    # instead of rebuilding the f-string piecewise per game; optional
+    # sections are precomputed values
+    _PROMPT_TEMPLATE = """GAME DATA:
+{away_name} ({away_record}) @ {home_name} ({home_record})
+Date: {game_time_display}
+Venue: {venue_name} ({venue_city}, {venue_state})
+Indoor: {indoor}
+Broadcast: {broadcast}
+
+HOME/AWAY SPLITS:
+{home_name}: {home_home_record} at home
+{away_name}: {away_away_record} on road
+
+TEAM LEADERS:
+{home_name}:
+{home_leaders}
+{away_name}:
+{away_leaders}
+BETTING LINES:
+{betting_lines}"""
+
+    _BETTING_TEMPLATE = """Spread: {spread}
+Over/Under: {over_under}
+Moneyline: {home_abbr} {home_moneyline} / {away_abbr} {away_moneyline}
+Source: {provider}
+"""
+
     def prepare_for_ai(self, game_data: Dict) -> str:
         """Format game data for AI consumption"""
-        
+
         home = game_data['home_team']
         away = game_data['away_team']
+        venue = game_data['venue']
         odds = game_data.get('odds', {})
-        
-        prompt = f"""GAME DATA:
-{away['name']} ({away['record']}) @ {home['name']} ({home['record']})
-Date: {game_data['game_time_display']}
-Venue: {game_data['venue']['name']} ({game_data['venue']['city']}, {game_data['venue']['state']})
-Indoor: {'Yes' if game_data['venue']['indoor'] else 'No'}
-Broadcast: {game_data['broadcast']}
 
-HOME/AWAY SPLITS:
-{home['name']}: {home['home_record']} at home
-{away['name']}: {away['away_record']} on road
-
-TEAM LEADERS:
-{home['name']}:
-"""
-        
-        if home['leaders'].get('passing'):
-            prompt += f"  QB: {home['leaders']['passing']['player']} - {home['leaders']['passing']['stats']}\n"
-        if home['leaders'].get('rushing'):
-            prompt += f"  RB: {home['leaders']['rushing']['player']} - {home['leaders']['rushing']['stats']}\n"
-        if home['leaders'].get('receiving'):
-            prompt += f"  WR: {home['leaders']['receiving']['player']} - {home['leaders']['receiving']['stats']}\n"
-        
-        prompt += f"\n{away['name']}:\n"
-        
-        if away['leaders'].get('passing'):
-            prompt += f"  QB: {away['leaders']['passing']['player']} - {away['leaders']['passing']['stats']}\n"
-        if away['leaders'].get('rushing'):
-            prompt += f"  RB: {away['leaders']['rushing']['player']} - {away['leaders']['rushing']['stats']}\n"
-        if away['leaders'].get('receiving'):
-            prompt += f"  WR: {away['leaders']['receiving']['player']} - {away['leaders']['receiving']['stats']}\n"
-        
-        prompt += "\nBETTING LINES:\n"
-        
         if odds:
-            prompt += f"""Spread: {odds.get('spread_details', 'N/A')}
-Over/Under: {odds.get('over_under', 'N/A')}
-Moneyline: {home['abbreviation']} {odds.get('home_moneyline', 'N/A')} / {away['abbreviation']} {odds.get('away_moneyline', 'N/A')}
-Source: {odds.get('provider', 'N/A')}
-"""
+            betting_lines = self._BETTING_TEMPLATE.format_map({
+                'spread': odds.get('spread', 'N/A'),
+                'over_under': odds.get('over_under', 'N/A'),
+                'home_abbr': home['abbreviation'],
+                'home_moneyline': odds.get('home_moneyline', 'N/A'),
+                'away_abbr': away['abbreviation'],
+                'away_moneyline': odds.get('away_moneyline', 'N/A'),
+                'provider': odds.get('provider', 'N/A'),
+            })
         else:
-            prompt += "Odds not yet available\n"
-        
-        return prompt
+            betting_lines = "Odds not yet available\n"
+
+        return self._PROMPT_TEMPLATE.format_map({
+            'home_name': home['name'],
+            'home_record': home['record'],
+            'home_home_record': home['home_record'],
+            'away_name': away['name'],
+            'away_record': away['record'],
+            'away_away_record': away['away_record'],
+            'game_time_display': game_data['game_time_display'],
+            'venue_name': venue['name'],
+            'venue_city': venue['city'],
+            'venue_state': venue['state'],
+            'indoor': 'Yes' if venue['indoor'] else 'No',
+            'broadcast': game_data['broadcast'],
+            'home_leaders': self._format_leaders(home['leaders']),
+            'away_leaders': self._format_leaders(away['leaders']),
+            'betting_lines': betting_lines,
+        })
 
 if __name__ == "__main__":
     # Test with current data
     import requests
-    
+
+    logging.basicConfig(level=logging.INFO)
+
+    # A Session keeps the TLS connection alive across fetches in a
+    # refresh loop; urllib3 negotiates the best compression it can
+    # decode (brotli when installed shrinks the payload ~20% vs gzip)
+    session = requests.Session()
+
     url = "https://site.api.espn.com/apis/site/v2/sports/football/nfl/scoreboard"
-    response = requests.get(url)
-    data = response.json()
+    response = session.get(url, timeout=5)
+    # Decoding the multi-hundred-KB scoreboard off the raw bytes is
+    # several times faster than the stdlib parser behind response.json()
+    data = decode_scoreboard(response.content)
     
     extractor = ESPNDataExtractor(data)
     games = extractor.get_all_games()
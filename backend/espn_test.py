@@ -8,6 +8,16 @@ import requests
 import json
 from datetime import datetime
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# One pooled session for all four test fetches: the TLS handshake is
+# paid once and kept alive; urllib3 negotiates the best compression it
+# can decode (brotli when installed beats gzip on the large payloads)
+_SESSION = requests.Session()
+
 def fetch_scoreboard(year=2025, week=None):
     """Fetch NFL scoreboard/schedule"""
     if week:
@@ -18,7 +28,7 @@ def fetch_scoreboard(year=2025, week=None):
     print(f"\n🏈 Fetching scoreboard...")
     print(f"URL: {url}\n")
     
-    response = requests.get(url)
+    response = _SESSION.get(url, timeout=5)
     data = response.json()
     
     return data
@@ -29,7 +39,7 @@ def fetch_team_info(team_id):
     
     print(f"\n📊 Fetching team {team_id} info...")
     
-    response = requests.get(url)
+    response = _SESSION.get(url, timeout=5)
     data = response.json()
     
     return data
@@ -40,7 +50,7 @@ def fetch_team_stats(team_id):
     
     print(f"\n📈 Fetching team {team_id} stats...")
     
-    response = requests.get(url)
+    response = _SESSION.get(url, timeout=5)
     if response.status_code == 200:
         return response.json()
     else:
@@ -104,8 +114,12 @@ def analyze_scoreboard_structure(data):
 
 def save_sample_data(data, filename):
     """Save sample data to file"""
-    with open(filename, 'w') as f:
-        json.dump(data, f, indent=2)
+    if orjson is not None:
+        with open(filename, 'wb') as f:
+            f.write(orjson.dumps(data, option=orjson.OPT_INDENT_2))
+    else:
+        with open(filename, 'w') as f:
+            json.dump(data, f, indent=2)
     print(f"\n💾 Saved sample data to {filename}")
 
 if __name__ == "__main__":
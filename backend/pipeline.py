@@ -6,16 +6,23 @@ Fetches ESPN data, generates AI analysis, stores in database
 Run this daily at 3 AM via cron or similar
 """
 
-import json
+import asyncio
+import logging
 import os
+import threading
 import sys
-from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
 from typing import Dict, List
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 # Import our modules
-from espn_extractor import ESPNDataExtractor
-from ai_analyzer import NFLAnalyzer
+from espn_extractor import ESPNDataExtractor, decode_scoreboard
+from ai_analyzer import NFLAnalyzer, atomic_write_json
+
+log = logging.getLogger(__name__)
 
 class NFLDataPipeline:
     """Complete data pipeline for NFL betting platform"""
@@ -33,7 +40,28 @@ class NFLDataPipeline:
             os.environ['OPENAI_API_KEY'] = openai_api_key
         
         self.analyzer = NFLAnalyzer()
-        
+
+        # Pooled session with keep-alive and transient-error retries:
+        # repeated fetches reuse one TLS connection, and 429/5xx from
+        # ESPN back off automatically instead of failing the run.
+        # Accept-Encoding is left to urllib3, which advertises the best
+        # codings it can actually decode (brotli when installed)
+        self.session = requests.Session()
+        self.session.headers.update({'User-Agent': 'edgerusher/1.0'})
+        self.session.mount('https://', HTTPAdapter(
+            pool_connections=10,
+            pool_maxsize=10,
+            max_retries=Retry(total=3, backoff_factor=0.3,
+                              status_forcelist=[429, 500, 502, 503, 504])
+        ))
+
+        # Warm up DNS + TLS to ESPN in the background while the rest of
+        # init runs; by fetch time the pool holds a keep-alive socket.
+        # Errors are ignored - the real GET will surface them.
+        threading.Thread(
+            target=self._preconnect_espn, daemon=True
+        ).start()
+
         # Stats
         self.stats = {
             'games_fetched': 0,
@@ -41,6 +69,14 @@ class NFLDataPipeline:
             'errors': []
         }
     
+    def _preconnect_espn(self):
+        """Open a keep-alive connection to ESPN ahead of the first fetch"""
+
+        try:
+            self.session.head('https://site.api.espn.com/', timeout=3)
+        except Exception:
+            pass
+
     def fetch_espn_data(self, week: int = None) -> Dict:
         """
         Fetch current week's games from ESPN
@@ -50,9 +86,9 @@ class NFLDataPipeline:
         """
         
         if self.use_mock_data:
-            print("📦 Using mock data...")
-            with open('mock_espn_data.json', 'r') as f:
-                return json.load(f)
+            log.info("📦 Using mock data...")
+            with open('mock_espn_data.json', 'rb') as f:
+                return decode_scoreboard(f.read())
         
         try:
             if week:
@@ -60,79 +96,102 @@ class NFLDataPipeline:
             else:
                 url = "https://site.api.espn.com/apis/site/v2/sports/football/nfl/scoreboard"
             
-            print(f"🏈 Fetching from ESPN: {url}")
-            response = requests.get(url, timeout=10)
+            log.info("🏈 Fetching from ESPN: %s", url)
+            response = self.session.get(url, timeout=10)
             response.raise_for_status()
-            
-            data = response.json()
+
+            # Decode off the raw bytes with the fastest parser available
+            # (msgspec/orjson) instead of the stdlib parser in .json()
+            data = decode_scoreboard(response.content)
             self.stats['games_fetched'] = len(data.get('events', []))
             
             return data
             
         except Exception as e:
             error_msg = f"Failed to fetch ESPN data: {e}"
-            print(f"❌ {error_msg}")
+            log.error("❌ %s", error_msg)
             self.stats['errors'].append(error_msg)
             return None
     
     def process_games(self, raw_data: Dict) -> List[Dict]:
         """
         Extract and analyze all games
-        
+
         Returns:
             List of complete game + analysis objects
         """
-        
+
+        return asyncio.run(self._process_games_async(raw_data))
+
+    async def _process_games_async(self, raw_data: Dict) -> List[Dict]:
+        """Pipeline extraction and analysis
+
+        Games are extracted in a small thread pool and each one is
+        handed to the analyzer the moment it is ready, so LLM calls for
+        early games overlap extraction of the rest - wall time is
+        max(extract, analyze) instead of their sum.
+        """
+
         if not raw_data:
             return []
-        
-        # Extract game data
+
         extractor = ESPNDataExtractor(raw_data)
-        games = extractor.get_all_games()
-        
-        print(f"\n📊 Processing {len(games)} games...")
-        
-        results = []
-        
-        for i, game in enumerate(games, 1):
-            print(f"\n{'='*60}")
-            print(f"Game {i}/{len(games)}: {game['away_team']['name']} @ {game['home_team']['name']}")
-            print(f"{'='*60}")
-            
-            try:
-                # Generate AI analysis
-                print("🤖 Generating AI analysis...")
-                analysis = self.analyzer.analyze_game(game)
-                
-                # Combine game data + analysis
-                complete_record = {
-                    'game_data': game,
-                    'analysis': analysis,
-                    'processed_at': datetime.utcnow().isoformat(),
-                    'status': 'complete'
-                }
-                
-                results.append(complete_record)
-                self.stats['games_analyzed'] += 1
-                
-                print("✅ Analysis complete")
-                
-            except Exception as e:
-                error_msg = f"Failed to analyze game {game['game_id']}: {e}"
-                print(f"❌ {error_msg}")
-                self.stats['errors'].append(error_msg)
-                
-                # Still save with error status
-                complete_record = {
-                    'game_data': game,
-                    'analysis': None,
-                    'processed_at': datetime.utcnow().isoformat(),
-                    'status': 'error',
-                    'error': str(e)
-                }
-                results.append(complete_record)
-        
-        return results
+        events = raw_data.get('events', [])
+
+        log.info("📊 Processing %d games...", len(events))
+
+        # One timestamp for the whole batch (utcnow() is also
+        # deprecated in 3.12)
+        processed_at = datetime.now(timezone.utc).isoformat(timespec='seconds')
+
+        # Cap in-flight OpenAI calls at the analyzer's concurrency knob;
+        # without it a full slate fired 16+ simultaneous requests
+        sem = asyncio.Semaphore(self.analyzer.concurrency)
+
+        async def analyze(game: Dict) -> Dict:
+            async with sem:
+                log.info("🤖 Analyzing %s @ %s...", game['away_team']['name'], game['home_team']['name'])
+
+                try:
+                    analysis = await self.analyzer.analyze_game_async(game, processed_at)
+                    self.stats['games_analyzed'] += 1
+                    log.info("✅ Analysis complete: %s", game['game_id'])
+
+                    return {
+                        'game_data': game,
+                        'analysis': analysis,
+                        'processed_at': processed_at,
+                        'status': 'complete'
+                    }
+
+                except Exception as e:
+                    error_msg = f"Failed to analyze game {game['game_id']}: {e}"
+                    log.error("❌ %s", error_msg)
+                    self.stats['errors'].append(error_msg)
+
+                    # Still save with error status
+                    return {
+                        'game_data': game,
+                        'analysis': None,
+                        'processed_at': processed_at,
+                        'status': 'error',
+                        'error': str(e)
+                    }
+
+        loop = asyncio.get_running_loop()
+        tasks = []
+
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            futures = [
+                loop.run_in_executor(pool, extractor._extract_game, event)
+                for event in events
+            ]
+            for future in asyncio.as_completed(futures):
+                game = await future
+                if game:
+                    tasks.append(asyncio.create_task(analyze(game)))
+
+        return list(await asyncio.gather(*tasks))
     
     def save_to_database(self, results: List[Dict]):
         """
@@ -142,36 +201,25 @@ class NFLDataPipeline:
         For now, we'll save to JSON files
         """
         
-        print(f"\n{'='*60}")
-        print("💾 SAVING RESULTS")
-        print(f"{'='*60}")
+        log.info("💾 Saving results")
         
         # Create output directory
         os.makedirs('output', exist_ok=True)
         
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         
-        # Save complete batch
+        # One batch artifact holds every game; the old per-game files
+        # re-serialized the same records a second time (1+N writes and
+        # double the disk bytes for a slate)
         batch_file = f"output/batch_{timestamp}.json"
-        with open(batch_file, 'w') as f:
-            json.dump({
-                'timestamp': timestamp,
-                'stats': self.stats,
-                'games': results
-            }, f, indent=2)
-        
-        print(f"✅ Saved batch: {batch_file}")
-        
-        # Save individual game files
-        for result in results:
-            game_id = result['game_data']['game_id']
-            game_file = f"output/game_{game_id}_{timestamp}.json"
-            
-            with open(game_file, 'w') as f:
-                json.dump(result, f, indent=2)
-            
-            print(f"  • Saved: game_{game_id}_{timestamp}.json")
-        
+        atomic_write_json(batch_file, {
+            'timestamp': timestamp,
+            'stats': self.stats,
+            'games': results
+        })
+
+        log.info("✅ Saved batch: %s (%d games)", batch_file, len(results))
+
         return batch_file
     
     def run(self, week: int = None):
@@ -182,50 +230,48 @@ class NFLDataPipeline:
             week: Specific week to process, or None for current
         """
         
-        print("="*60)
-        print("🏈 NFL BETTING PLATFORM - DAILY PIPELINE")
-        print("="*60)
-        print(f"Started: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-        print(f"Season: {self.season_year}")
-        print(f"Week: {week if week else 'Current'}")
-        print(f"Mock Data: {self.use_mock_data}")
-        print("="*60)
-        
+        log.info("🏈 NFL BETTING PLATFORM - DAILY PIPELINE")
+        log.info("Started: %s | Season: %s | Week: %s | Mock Data: %s",
+                 datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                 self.season_year, week if week else 'Current', self.use_mock_data)
+
         # Step 1: Fetch data
-        print("\n📡 STEP 1: Fetching ESPN Data")
+        log.info("📡 STEP 1: Fetching ESPN Data")
         raw_data = self.fetch_espn_data(week)
-        
+
         if not raw_data:
-            print("❌ Pipeline failed: No data fetched")
+            log.error("❌ Pipeline failed: No data fetched")
             return
-        
+
         # Step 2: Process games
-        print("\n🔧 STEP 2: Processing Games")
+        log.info("🔧 STEP 2: Processing Games")
         results = self.process_games(raw_data)
-        
+
         # Step 3: Save to database
-        print("\n💾 STEP 3: Saving to Database")
+        log.info("💾 STEP 3: Saving to Database")
         batch_file = self.save_to_database(results)
-        
+
         # Final stats
-        print("\n" + "="*60)
-        print("✅ PIPELINE COMPLETE")
-        print("="*60)
-        print(f"Games fetched: {self.stats['games_fetched']}")
-        print(f"Games analyzed: {self.stats['games_analyzed']}")
-        print(f"Errors: {len(self.stats['errors'])}")
-        
-        if self.stats['errors']:
-            print("\nErrors encountered:")
-            for error in self.stats['errors']:
-                print(f"  • {error}")
-        
-        print(f"\nBatch saved to: {batch_file}")
-        print("="*60)
+        log.info("✅ PIPELINE COMPLETE")
+        log.info("Games fetched: %d | analyzed: %d | errors: %d",
+                 self.stats['games_fetched'], self.stats['games_analyzed'],
+                 len(self.stats['errors']))
+
+        for error in self.stats['errors']:
+            log.warning("  • %s", error)
+
+        log.info("Batch saved to: %s", batch_file)
 
 def main():
     """Main entry point"""
-    
+
+    # Formatting is deferred to the handler, so suppressed levels cost
+    # only the isEnabledFor check instead of building every message
+    logging.basicConfig(
+        level=os.getenv('LOG_LEVEL', 'INFO'),
+        format='%(asctime)s %(levelname)s %(message)s'
+    )
+
     # Configuration
     OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
     SEASON_YEAR = int(os.getenv('SEASON_YEAR', '2025'))
@@ -235,8 +281,8 @@ def main():
     USE_MOCK = not OPENAI_API_KEY
     
     if USE_MOCK:
-        print("⚠️  No OPENAI_API_KEY found - using mock data for testing")
-        print("Set with: export OPENAI_API_KEY='your-key-here'\n")
+        log.warning("⚠️  No OPENAI_API_KEY found - using mock data for testing")
+        log.warning("Set with: export OPENAI_API_KEY='your-key-here'")
     
     # Run pipeline
     pipeline = NFLDataPipeline(
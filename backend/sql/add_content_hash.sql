@@ -0,0 +1,4 @@
+-- Run once in the Supabase SQL editor.
+-- Stores a hash of the game content each analysis was generated from,
+-- so pipeline re-runs can skip OpenAI calls for unchanged games.
+alter table ai_outputs add column if not exists content_hash text;
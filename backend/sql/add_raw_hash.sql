@@ -0,0 +1,4 @@
+-- Run once in the Supabase SQL editor.
+-- Stores a canonical hash of each raw ESPN payload so repeat pipeline
+-- runs can skip re-upserting games_raw rows that haven't changed.
+alter table games_raw add column if not exists raw_hash text;
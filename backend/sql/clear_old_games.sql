@@ -0,0 +1,10 @@
+-- Run once in the Supabase SQL editor.
+-- TRUNCATE is O(1) metadata work (no per-row WAL like DELETE), and one
+-- RPC replaces the two full-table DELETE round-trips the old script made.
+create or replace function clear_old_games()
+returns void
+language sql
+security definer
+as $$
+  truncate ai_outputs, games_raw restart identity cascade;
+$$;
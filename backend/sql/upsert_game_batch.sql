@@ -0,0 +1,44 @@
+-- Run once in the Supabase SQL editor.
+-- One RPC upserts a whole run's rows into both tables in a single HTTP
+-- request and one transaction, instead of one round-trip per table, and
+-- a game's raw payload and analysis can no longer land without each other.
+create or replace function upsert_game_batch(games jsonb, ai jsonb)
+returns void
+language plpgsql
+security definer
+as $$
+begin
+  insert into games_raw (game_id, raw_json, raw_hash, week, season_year, game_time, fetched_at)
+  select game_id, raw_json, raw_hash, week, season_year, game_time, fetched_at
+  from jsonb_populate_recordset(null::games_raw, games)
+  on conflict (game_id) do update set
+    raw_json = excluded.raw_json,
+    raw_hash = excluded.raw_hash,
+    week = excluded.week,
+    season_year = excluded.season_year,
+    game_time = excluded.game_time,
+    fetched_at = excluded.fetched_at;
+
+  insert into ai_outputs (game_id, top_insight, summary, ai_lean, angles,
+                          predicted_line, predicted_total, team_strength,
+                          injury_impact, confidence_score, content_hash,
+                          analyzed_at)
+  select game_id, top_insight, summary, ai_lean, angles,
+         predicted_line, predicted_total, team_strength,
+         injury_impact, confidence_score, content_hash,
+         analyzed_at
+  from jsonb_populate_recordset(null::ai_outputs, ai)
+  on conflict (game_id) do update set
+    top_insight = excluded.top_insight,
+    summary = excluded.summary,
+    ai_lean = excluded.ai_lean,
+    angles = excluded.angles,
+    predicted_line = excluded.predicted_line,
+    predicted_total = excluded.predicted_total,
+    team_strength = excluded.team_strength,
+    injury_impact = excluded.injury_impact,
+    confidence_score = excluded.confidence_score,
+    content_hash = excluded.content_hash,
+    analyzed_at = excluded.analyzed_at;
+end;
+$$;